@@ -3,57 +3,195 @@ Wellness Tracker App - Main Application
 A prototype wellness tracking app that collects daily self-reports and generates personalized wellness scores.
 """
 
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, abort, stream_with_context, url_for
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, func, insert, inspect, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.schema import CreateTable
 from flask_cors import CORS
-from datetime import datetime, date
+from datetime import date
 import os
+import sqlite3
 from dotenv import load_dotenv
 import json
+import functools
+import hashlib
+import math
+import operator
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 # Optional OpenAI import (kept lazy for tests/fallback)
 try:
+    import httpx  # installed with the OpenAI SDK
     from openai import OpenAI  # openai==1.3.7
 except Exception:  # pragma: no cover
     OpenAI = None  # type: ignore
 
+# Optional orjson for faster JSON encoding on read-heavy endpoints (stdlib json fallback)
+try:
+    import orjson
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
+
 # Load environment variables
 load_dotenv()
 
+class OrjsonJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson.
+
+    Unlike Flask's default provider, dates and datetimes encode as ISO 8601 strings rather
+    than HTTP dates, so handlers format dates themselves to keep responses identical when
+    orjson is not installed. Non-string dict keys are converted to strings, as json does.
+    """
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+if orjson is not None:
+    app.json = OrjsonJSONProvider(app)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'wellness-tracker-dev-key')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///wellness_tracker.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Connection pooling for server databases (PostgreSQL/MySQL). SQLite keeps the driver
+# defaults: in-memory databases need a single shared StaticPool connection.
+if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', '10')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '20')),
+        'pool_timeout': 30,
+        'pool_recycle': 3600,  # recycle before server-side idle timeouts drop connections
+        'pool_pre_ping': True,
+    }
 
 db = SQLAlchemy(app)
+
+@event.listens_for(Engine, 'connect')
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    """Tune SQLite connections: enforce foreign keys (off by default) and use WAL.
+
+    WAL with synchronous=NORMAL avoids an fsync of a rollback journal on every commit
+    and lets readers proceed while a write is in progress.
+    """
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.execute('PRAGMA mmap_size=268435456')  # 256 MiB of memory-mapped reads
+        cursor.close()
 CORS(app)
 
 # OpenAI configuration (env-driven)
 # IMPORTANT: keep secrets in environment/.env only
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')  # Valid default model
+OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')  # Supports automatic prompt caching
+OPENAI_EMBEDDING_MODEL = os.getenv('OPENAI_EMBEDDING_MODEL', 'text-embedding-3-small')
+
+# Symptom narratives shorter than this (after stripping) are too brief to analyze
+MIN_SYMPTOM_LENGTH = 10
+
+# Upper bound on reports accepted by one batch import request
+MAX_BATCH_REPORTS = int(os.getenv('MAX_BATCH_REPORTS', '1000'))
+
+# Generate AI insights on a background worker pool so report submission does not wait
+# on the LLM; set AI_INSIGHTS_ASYNC=0 to generate them inline (tests, debugging)
+app.config['AI_INSIGHTS_ASYNC'] = os.getenv('AI_INSIGHTS_ASYNC', '1') == '1'
+_INSIGHTS_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv('AI_INSIGHTS_WORKERS', '4')),
+    thread_name_prefix='ai-insights',
+)
+
+# Circuit breaker: after this many consecutive OpenAI failures, skip the LLM for a cool-down
+LLM_CIRCUIT_THRESHOLD = int(os.getenv('LLM_CIRCUIT_THRESHOLD', '5'))
+LLM_CIRCUIT_COOLDOWN = float(os.getenv('LLM_CIRCUIT_COOLDOWN', '60'))  # seconds
+
+# Insight cache: exact hits by prompt hash, near-duplicates by embedding cosine similarity
+INSIGHT_CACHE_MAXSIZE = int(os.getenv('INSIGHT_CACHE_MAXSIZE', '1024'))
+INSIGHT_CACHE_TTL = float(os.getenv('INSIGHT_CACHE_TTL', '3600'))  # seconds
+INSIGHT_CACHE_SIMILARITY = float(os.getenv('INSIGHT_CACHE_SIMILARITY', '0.92'))
+
+def _build_openai_client():
+    """Create the shared OpenAI client, or None when not configured.
+
+    One client per process keeps its keep-alive connection pool, so LLM calls reuse
+    TLS connections instead of handshaking with api.openai.com on every request.
+    """
+    if not OPENAI_API_KEY or OpenAI is None:
+        return None
+    try:
+        return OpenAI(
+            api_key=OPENAI_API_KEY,
+            timeout=15.0,
+            max_retries=2,
+            http_client=httpx.Client(
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            ),
+        )
+    except Exception as e:
+        app.logger.error(f'OpenAI client setup failed: {e}')
+        return None
+
+_OPENAI_CLIENT = _build_openai_client()
 
 # Simple in-memory status for debugging LLM usage (non-sensitive)
 LLM_STATUS = {
-    'enabled': bool(OPENAI_API_KEY and OpenAI is not None),
+    'enabled': _OPENAI_CLIENT is not None,
     'model': OPENAI_MODEL,
     'llm_attempted': False,
     'llm_success': False,
     'last_llm_error': None,
+    'cache_hits': 0,
+    'last_cached_prompt_tokens': None,
+    'consecutive_failures': 0,
+    'circuit_open': False,
 }
 
+_CB = {'failures': 0, 'open_until': 0.0}  # open_until is a time.monotonic() deadline
+_CB_LOCK = threading.Lock()
+
+# key -> (expires_at, metrics context, unit-length embedding or None, completion text); oldest first
+_INSIGHT_CACHE = OrderedDict()
+_INSIGHT_CACHE_LOCK = threading.Lock()
+
 # Database Models
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    wellness_reports = db.relationship('WellnessReport', backref='user', lazy=True)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
+    # lazy='raise': load reports explicitly (query or selectinload) instead of per-user N+1 selects
+    wellness_reports = db.relationship('WellnessReport', back_populates='user', lazy='raise')
 
 class WellnessReport(db.Model):
+    __table_args__ = (
+        # Serves the per-user, newest-first lookups and enforces one report per user per day
+        db.Index('ix_report_user_date', 'user_id', 'report_date', unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    report_date = db.Column(db.Date, default=date.today)
+    report_date = db.Column(db.Date, server_default=func.current_date())  # UTC date on SQLite
     mood_score = db.Column(db.Integer)  # 1-10 scale
     energy_level = db.Column(db.Integer)  # 1-10 scale
     sleep_quality = db.Column(db.Integer)  # 1-10 scale
@@ -61,7 +199,21 @@ class WellnessReport(db.Model):
     physical_symptoms = db.Column(db.Text)  # Free text description
     wellness_score = db.Column(db.Float)  # Calculated score
     ai_insights = db.Column(db.Text)  # LLM-generated insights
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
+    user = db.relationship('User', back_populates='wellness_reports')
+
+# Columns returned by the report read endpoints, selected as plain rows
+_REPORT_COLUMNS = (
+    WellnessReport.id,
+    WellnessReport.report_date,
+    WellnessReport.mood_score,
+    WellnessReport.energy_level,
+    WellnessReport.sleep_quality,
+    WellnessReport.stress_level,
+    WellnessReport.physical_symptoms,
+    WellnessReport.wellness_score,
+    WellnessReport.ai_insights,
+)
 
 # Routes
 @app.route('/')
@@ -92,19 +244,6 @@ def submit_wellness_report(user_id):
     """Submit a daily wellness report"""
     data = request.get_json()
     
-    # Validate user exists
-    user = User.query.get_or_404(user_id)
-    
-    # Check if report already exists for today
-    today = date.today()
-    existing_report = WellnessReport.query.filter_by(
-        user_id=user_id, 
-        report_date=today
-    ).first()
-    
-    if existing_report:
-        return jsonify({'error': 'Report already submitted for today'}), 400
-    
     # Validate required fields
     required_fields = ['mood_score', 'energy_level', 'sleep_quality', 'stress_level']
     for field in required_fields:
@@ -114,223 +253,787 @@ def submit_wellness_report(user_id):
     # Calculate wellness score
     wellness_score = calculate_wellness_score(data)
     
-    # Process symptom narrative with LLM (if provided)
-    ai_insights = None
-    if data.get('physical_symptoms'):
-        ai_insights = generate_ai_insights(data['physical_symptoms'])
+    # Create report; the unique (user_id, report_date) index rejects a second report today
+    # and the user foreign key rejects unknown users, so no SELECT probes are needed
+    try:
+        report_id = _insert_report_if_absent({
+            'user_id': user_id,
+            'mood_score': data['mood_score'],
+            'energy_level': data['energy_level'],
+            'sleep_quality': data['sleep_quality'],
+            'stress_level': data['stress_level'],
+            'physical_symptoms': data.get('physical_symptoms', ''),
+            'wellness_score': wellness_score,
+        })
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        if db.session.get(User, user_id) is None:
+            abort(404)
+        report_id = None
     
-    # Create report
-    report = WellnessReport(
-        user_id=user_id,
-        mood_score=data['mood_score'],
-        energy_level=data['energy_level'],
-        sleep_quality=data['sleep_quality'],
-        stress_level=data['stress_level'],
-        physical_symptoms=data.get('physical_symptoms', ''),
-        wellness_score=wellness_score,
-        ai_insights=ai_insights
-    )
+    if report_id is None:
+        return jsonify({'error': 'Report already submitted for today'}), 400
     
-    db.session.add(report)
-    db.session.commit()
+    # Process symptom narrative with LLM (if substantive) once the report is stored
+    ai_insights = None
+    symptom_text = (data.get('physical_symptoms') or '').strip()
+    if len(symptom_text) >= MIN_SYMPTOM_LENGTH:
+        metrics = {field: data[field] for field in required_fields}
+        stream_insights = bool(data.get('stream_insights'))
+        if stream_insights or app.config['AI_INSIGHTS_ASYNC']:
+            response = {
+                'id': report_id,
+                'wellness_score': wellness_score,
+                'ai_insights': None,
+                'ai_insights_status': 'pending',
+                'message': 'Wellness report submitted successfully'
+            }
+            if stream_insights:
+                # The client opens the stream, which generates and stores the insights
+                response['insights_stream_url'] = url_for(
+                    'stream_ai_insights', user_id=user_id, report_id=report_id)
+            else:
+                _INSIGHTS_EXECUTOR.submit(_fill_ai_insights, report_id, symptom_text, metrics)
+            return jsonify(response), 202, {
+                'Location': url_for('get_wellness_report', user_id=user_id, report_id=report_id)}
+        ai_insights = _fill_ai_insights(report_id, symptom_text, metrics)
     
     return jsonify({
-        'id': report.id,
+        'id': report_id,
         'wellness_score': wellness_score,
         'ai_insights': ai_insights,
+        'ai_insights_status': 'ready',
         'message': 'Wellness report submitted successfully'
     }), 201
 
+@app.route('/api/users/<int:user_id>/reports/batch', methods=['POST'])
+def submit_wellness_reports_batch(user_id):
+    """Import historical wellness reports in one transaction (keyword insights, no LLM calls)"""
+    data = request.get_json(silent=True)
+    reports = data.get('reports') if isinstance(data, dict) else None
+    
+    if not isinstance(reports, list) or not reports:
+        return jsonify({'error': 'reports must be a non-empty list'}), 400
+    if len(reports) > MAX_BATCH_REPORTS:
+        return jsonify({'error': f'At most {MAX_BATCH_REPORTS} reports per batch'}), 400
+    
+    # Validate every row before writing anything. Only past days are accepted: today's row
+    # belongs to the regular submission, which uses the database's current (UTC) date
+    required_fields = ['mood_score', 'energy_level', 'sleep_quality', 'stress_level']
+    today = db.session.scalar(select(func.current_date()))
+    report_dates = []
+    for index, report in enumerate(reports):
+        if not isinstance(report, dict):
+            return jsonify({'error': f'reports[{index}] must be an object'}), 400
+        for field in required_fields:
+            if report.get(field) is None:
+                return jsonify({'error': f'reports[{index}].{field} is required'}), 400
+            if not isinstance(report[field], int) or isinstance(report[field], bool):
+                return jsonify({'error': f'reports[{index}].{field} must be an integer'}), 400
+        if not isinstance(report.get('physical_symptoms') or '', str):
+            return jsonify({'error': f'reports[{index}].physical_symptoms must be a string'}), 400
+        try:
+            report_dates.append(date.fromisoformat(report['report_date']))
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': f'reports[{index}].report_date must be a date (YYYY-MM-DD)'}), 400
+        if report_dates[-1] >= today:
+            return jsonify({'error': f'reports[{index}].report_date must be before today'}), 400
+    
+    if len(set(report_dates)) != len(report_dates):
+        return jsonify({'error': 'Only one report per date is allowed'}), 400
+    
+    # Score all rows at once, then insert them with a single executemany and commit
+    wellness_scores = calculate_wellness_scores_batch(
+        [tuple(report[field] for field in required_fields) for report in reports])
+    # Imported narratives get the offline insights so no row is left pending forever
+    ai_insights = []
+    for report in reports:
+        symptom_text = (report.get('physical_symptoms') or '').strip()
+        ai_insights.append(_keyword_insights(symptom_text.lower())
+                           if len(symptom_text) >= MIN_SYMPTOM_LENGTH else None)
+    
+    try:
+        db.session.bulk_insert_mappings(WellnessReport, [{
+            'user_id': user_id,
+            'report_date': report_date,
+            'mood_score': report['mood_score'],
+            'energy_level': report['energy_level'],
+            'sleep_quality': report['sleep_quality'],
+            'stress_level': report['stress_level'],
+            'physical_symptoms': report.get('physical_symptoms', ''),
+            'wellness_score': wellness_score,
+            'ai_insights': insights,
+        } for report, report_date, wellness_score, insights
+            in zip(reports, report_dates, wellness_scores, ai_insights)])
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        if db.session.get(User, user_id) is None:
+            abort(404)
+        return jsonify({'error': 'A report already exists for one or more of these dates'}), 400
+    
+    return jsonify({
+        'inserted': len(reports),
+        'wellness_scores': wellness_scores,
+        'message': 'Wellness reports imported successfully'
+    }), 201
+
+@app.route('/api/users/<int:user_id>/reports/<int:report_id>', methods=['GET'])
+def get_wellness_report(user_id, report_id):
+    """Get a single wellness report; poll here until pending AI insights are ready"""
+    row = db.session.execute(
+        select(*_REPORT_COLUMNS)
+        .where(WellnessReport.id == report_id, WellnessReport.user_id == user_id)
+    ).first()
+    if row is None:
+        abort(404)
+    
+    report = _report_dict(row)
+    pending = (report['ai_insights'] is None
+               and len((report['physical_symptoms'] or '').strip()) >= MIN_SYMPTOM_LENGTH)
+    report['ai_insights_status'] = 'pending' if pending else 'ready'
+    return jsonify(report)
+
+@app.route('/api/users/<int:user_id>/reports/<int:report_id>/insights/stream', methods=['GET'])
+def stream_ai_insights(user_id, report_id):
+    """Stream AI insights for a report as server-sent events, then store the full text"""
+    row = db.session.execute(
+        select(*_REPORT_COLUMNS)
+        .where(WellnessReport.id == report_id, WellnessReport.user_id == user_id)
+    ).first()
+    if row is None:
+        abort(404)
+    # End the read transaction so no connection (or SQLite snapshot) is held open while the
+    # LLM streams; the UPDATE below runs in a transaction of its own
+    db.session.commit()
+
+    def generate():
+        if row.ai_insights is not None:
+            yield _sse_event(row.ai_insights)
+            yield _sse_event('', event='done')
+            return
+
+        symptom_text = (row.physical_symptoms or '').strip()
+        lower_text = symptom_text.lower()
+        metrics = {
+            'mood_score': row.mood_score,
+            'energy_level': row.energy_level,
+            'sleep_quality': row.sleep_quality,
+            'stress_level': row.stress_level,
+        }
+        if len(symptom_text) < MIN_SYMPTOM_LENGTH:
+            # Trivial narratives keep NULL insights and are already reported ready
+            yield _sse_event('', event='done')
+            return
+
+        parts = []
+        try:
+            for delta in _stream_llm_insights(symptom_text, lower_text, metrics):
+                parts.append(delta)
+                yield _sse_event(delta)
+        except Exception:
+            parts = []  # discard a partial completion
+
+        ai_insights = "".join(parts).strip()
+        if not ai_insights:
+            ai_insights = _keyword_insights(lower_text)
+            yield _sse_event(ai_insights, event='replace')
+
+        db.session.execute(
+            update(WellnessReport)
+            .where(WellnessReport.id == report_id, WellnessReport.ai_insights.is_(None))
+            .values(ai_insights=ai_insights)
+        )
+        db.session.commit()
+        yield _sse_event('', event='done')
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/users/<int:user_id>/reports', methods=['GET'])
 def get_wellness_reports(user_id):
     """Get wellness reports for a user"""
-    user = User.query.get_or_404(user_id)
-    
     # Get date range from query params
     days = request.args.get('days', 30, type=int)
     
-    reports = WellnessReport.query.filter_by(user_id=user_id)\
-        .order_by(WellnessReport.report_date.desc())\
-        .limit(days).all()
+    # One query checks the user exists and yields the validator, so a matching
+    # If-None-Match is answered without loading or serializing any reports
+    state = _user_report_state(user_id, 'reports', days, insights_window=days)
+    if state is None:
+        abort(404)
+    _, etag = state
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
     
-    return jsonify([{
-        'id': report.id,
-        'report_date': report.report_date.isoformat(),
-        'mood_score': report.mood_score,
-        'energy_level': report.energy_level,
-        'sleep_quality': report.sleep_quality,
-        'stress_level': report.stress_level,
-        'physical_symptoms': report.physical_symptoms,
-        'wellness_score': report.wellness_score,
-        'ai_insights': report.ai_insights
-    } for report in reports])
+    # Plain row tuples: read-only listing, so skip ORM object hydration
+    rows = db.session.execute(
+        select(*_REPORT_COLUMNS).where(WellnessReport.user_id == user_id)
+        .order_by(WellnessReport.report_date.desc())
+        .limit(days)
+    ).all()
+
+    return _with_etag(jsonify([_report_dict(row) for row in rows]), etag)
 
 @app.route('/api/users/<int:user_id>/wellness-summary', methods=['GET'])
 def get_wellness_summary(user_id):
     """Get wellness summary and trends for a user"""
-    user = User.query.get_or_404(user_id)
+    state = _user_report_state(user_id, 'summary')
+    if state is None:
+        abort(404)
+    username, etag = state
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
     
-    # Get recent reports for trend analysis
-    recent_reports = WellnessReport.query.filter_by(user_id=user_id)\
+    # Aggregate the 30 most recent reports in the database (one row, no ORM objects)
+    recent = db.session.query(
+        WellnessReport.report_date,
+        WellnessReport.mood_score,
+        WellnessReport.energy_level,
+        WellnessReport.sleep_quality,
+        WellnessReport.stress_level,
+        WellnessReport.wellness_score,
+    ).filter_by(user_id=user_id)\
         .order_by(WellnessReport.report_date.desc())\
-        .limit(30).all()
-    
-    if not recent_reports:
+        .limit(30).subquery()
+
+    (total_reports, avg_wellness_score, avg_mood, avg_energy, avg_sleep, avg_stress,
+     latest_report_date) = db.session.query(
+        func.count(),
+        func.avg(recent.c.wellness_score),
+        func.avg(recent.c.mood_score),
+        func.avg(recent.c.energy_level),
+        func.avg(recent.c.sleep_quality),
+        func.avg(recent.c.stress_level),
+        func.max(recent.c.report_date),
+    ).one()
+
+    if not total_reports:
         return jsonify({'message': 'No reports found'}), 404
     
-    # Calculate averages and trends
-    avg_wellness_score = sum(r.wellness_score for r in recent_reports) / len(recent_reports)
-    avg_mood = sum(r.mood_score for r in recent_reports) / len(recent_reports)
-    avg_energy = sum(r.energy_level for r in recent_reports) / len(recent_reports)
-    avg_sleep = sum(r.sleep_quality for r in recent_reports) / len(recent_reports)
-    avg_stress = sum(r.stress_level for r in recent_reports) / len(recent_reports)
-    
-    return jsonify({
+    return _with_etag(jsonify({
         'user_id': user_id,
-        'username': user.username,
-        'total_reports': len(recent_reports),
-        'average_wellness_score': round(avg_wellness_score, 2),
+        'username': username,
+        'total_reports': total_reports,
+        'average_wellness_score': round(float(avg_wellness_score), 2),
         'averages': {
-            'mood_score': round(avg_mood, 2),
-            'energy_level': round(avg_energy, 2),
-            'sleep_quality': round(avg_sleep, 2),
-            'stress_level': round(avg_stress, 2)
+            'mood_score': round(float(avg_mood), 2),
+            'energy_level': round(float(avg_energy), 2),
+            'sleep_quality': round(float(avg_sleep), 2),
+            'stress_level': round(float(avg_stress), 2)
         },
-        'latest_report_date': recent_reports[0].report_date.isoformat() if recent_reports else None
-    })
+        'latest_report_date': latest_report_date.isoformat() if latest_report_date else None
+    }), etag)
+
+def _insert_report_if_absent(values) -> Optional[int]:
+    """Insert a report in one statement; return its id, or None if one exists for that day.
+
+    PostgreSQL and SQLite use INSERT ... ON CONFLICT DO NOTHING RETURNING id. Other
+    backends raise IntegrityError on a duplicate, which callers already handle.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        dialect_insert = pg_insert if dialect == 'postgresql' else sqlite_insert
+        stmt = dialect_insert(WellnessReport).values(**values)\
+            .on_conflict_do_nothing(index_elements=['user_id', 'report_date'])\
+            .returning(WellnessReport.id)
+        return db.session.execute(stmt).scalar()
+    return db.session.execute(insert(WellnessReport).values(**values)).inserted_primary_key[0]
+
+def _user_report_state(user_id, *parts, insights_window=None):
+    """Look up a user and a validator for their report data in one indexed query.
+
+    Returns (username, etag), or None when the user does not exist. Reports are only
+    ever inserted and later have ai_insights filled in once, so the newest id changes on
+    every insert. Payloads that include ai_insights pass insights_window, the number of
+    newest reports they return; the count of those with insights is added to the key,
+    so only that window is read rather than the user's whole history.
+    """
+    columns = [User.username, func.max(WellnessReport.id)]
+    if insights_window is not None:
+        window = select(WellnessReport.ai_insights)\
+            .where(WellnessReport.user_id == user_id)\
+            .order_by(WellnessReport.report_date.desc())\
+            .limit(insights_window).subquery()
+        columns.append(select(func.count(window.c.ai_insights)).scalar_subquery())
+    row = db.session.query(*columns)\
+        .outerjoin(WellnessReport, WellnessReport.user_id == User.id)\
+        .filter(User.id == user_id)\
+        .group_by(User.id, User.username).first()
+    if row is None:
+        return None
+
+    username, *versions = row
+    key = ":".join(str(part) for part in (user_id, *versions, *parts))
+    return username, hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest()
+
+def _with_etag(response, etag):
+    """Attach the validator; no-cache makes clients revalidate instead of reusing stale data."""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _not_modified(etag):
+    """Empty 304 response for a client whose cached copy is still current."""
+    return _with_etag(app.response_class(status=304), etag)
+
+def _sse_event(text, event=None):
+    """Format one server-sent event; data is a JSON string so newlines survive framing."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(text)}\n\n"
+
+def _report_dict(row):
+    """Report row as a JSON-ready dict; the date is formatted here so every JSON provider agrees."""
+    report = dict(row._mapping)
+    report['report_date'] = report['report_date'].isoformat() if report['report_date'] else None
+    return report
+
+# Wellness score weights for (mood, energy, sleep, stress). Stress is inverted as
+# (10 - stress) * weight, i.e. a constant bias minus stress * weight.
+WELLNESS_WEIGHTS = (0.3, 0.25, 0.25, 0.2)
+_STRESS_BIAS = 10 * WELLNESS_WEIGHTS[3]
 
 def calculate_wellness_score(report_data):
     """Calculate personalized wellness score based on self-reported metrics"""
-    # Weighted scoring algorithm
-    # Higher scores for positive metrics, inverse for stress
-    mood_weight = 0.3
-    energy_weight = 0.25
-    sleep_weight = 0.25
-    stress_weight = -0.2  # Negative weight as higher stress = lower wellness
-    
-    score = (
-        report_data['mood_score'] * mood_weight +
-        report_data['energy_level'] * energy_weight +
-        report_data['sleep_quality'] * sleep_weight +
-        (10 - report_data['stress_level']) * abs(stress_weight)  # Invert stress scale
-    )
-    
-    # Normalize to 0-100 scale
-    normalized_score = (score / 10) * 100
-    return round(normalized_score, 2)
+    return calculate_wellness_scores_batch([(
+        report_data['mood_score'],
+        report_data['energy_level'],
+        report_data['sleep_quality'],
+        report_data['stress_level'],
+    )])[0]
 
-def _keyword_insights(symptom_text: str) -> str:
-    """Deterministic, offline insights used as a safe fallback (and in tests)."""
-    if not symptom_text or len(symptom_text.strip()) < 10:
-        return "No significant symptoms reported."
+def calculate_wellness_scores_batch(metric_rows):
+    """Score many (mood, energy, sleep, stress) tuples in one pass, e.g. for re-weighting history.
 
-    keywords = {
-        'pain': 'Consider rest and gentle movement. Monitor pain levels.',
-        'tired': 'Focus on sleep hygiene and energy management.',
-        'anxious': 'Practice relaxation techniques and mindfulness.',
-        'headache': 'Stay hydrated and consider stress management.',
-        'nausea': 'Monitor food intake and consider dietary adjustments.',
-        'dizzy': 'Ensure adequate hydration and rest.'
-    }
+    Returns scores normalized to a 0-100 scale, in input order.
+    """
+    mood_weight, energy_weight, sleep_weight, stress_weight = WELLNESS_WEIGHTS
+    bias = _STRESS_BIAS
+    return [
+        round((mood * mood_weight + energy * energy_weight + sleep * sleep_weight
+               - stress * stress_weight + bias) * 10, 2)
+        for mood, energy, sleep, stress in metric_rows
+    ]
+
+# (keyword, advice) pairs for the offline fallback; order sets the order of advice.
+# Matching uses one `in` scan per keyword: for a handful of keywords CPython's substring
+# search beats a single-pass automaton (pyahocorasick measured 2-3x slower, a regex
+# alternation 4-10x slower, on 70-36k character narratives). Revisit if this list grows large.
+SYMPTOM_KEYWORDS = (
+    ('pain', 'Consider rest and gentle movement. Monitor pain levels.'),
+    ('tired', 'Focus on sleep hygiene and energy management.'),
+    ('anxious', 'Practice relaxation techniques and mindfulness.'),
+    ('headache', 'Stay hydrated and consider stress management.'),
+    ('nausea', 'Monitor food intake and consider dietary adjustments.'),
+    ('dizzy', 'Ensure adequate hydration and rest.'),
+)
+
+
+@functools.lru_cache(maxsize=512)
+def _keyword_insights(lower_text: str) -> str:
+    """Deterministic, offline insights used as a safe fallback (and in tests).
+
+    Expects the narrative already stripped and lowercased, as generate_ai_insights does.
+    """
+    if len(lower_text) < MIN_SYMPTOM_LENGTH:
+        return "No significant symptoms reported."
 
-    insights = []
-    lower_text = symptom_text.lower()
-    for keyword, advice in keywords.items():
-        if keyword in lower_text:
-            insights.append(advice)
+    insights = [advice for keyword, advice in SYMPTOM_KEYWORDS if keyword in lower_text]
 
     if insights:
         return "Insights based on reported symptoms: " + " ".join(insights)
     return "Continue monitoring symptoms and maintain healthy habits."
 
 
-def _llm_insights(symptom_text: str, metrics: Optional[dict] = None) -> Optional[str]:
+def _insight_cache_key(lower_text: str, context: str) -> str:
+    """Hash of the normalized prompt inputs; case and whitespace do not change the key."""
+    normalized = " ".join(lower_text.split())
+    return hashlib.sha256(f"{normalized}|{context}".encode("utf-8")).hexdigest()
+
+
+def _embed_text(client, text: str) -> Optional[list]:
+    """Return a unit-length embedding for text, or None if the embeddings call fails.
+
+    Failures count toward the LLM circuit breaker (an outage usually hits both endpoints);
+    successes do not reset it, so a healthy embeddings API cannot mask failing completions.
+    """
+    try:
+        response = client.embeddings.create(model=OPENAI_EMBEDDING_MODEL, input=text)
+        vector = response.data[0].embedding
+    except Exception as e:
+        _record_llm_outcome(False)
+        app.logger.warning(f'Embedding call failed, semantic cache skipped: {e}')
+        return None
+    norm = math.sqrt(sum(map(operator.mul, vector, vector)))
+    return [v / norm for v in vector] if norm else None
+
+
+def _cache_lookup(key: str, context: str, embedding: Optional[list] = None) -> Optional[str]:
+    """Return a cached completion for an exact key match, else for the most similar embedding.
+
+    Semantic matches are limited to entries with the same metrics context: a similar
+    narrative with different scores needs different advice. The similarity scan runs on
+    a snapshot outside the lock so it never blocks other lookups or stores.
+    """
+    now = time.monotonic()
+    with _INSIGHT_CACHE_LOCK:
+        entry = _INSIGHT_CACHE.get(key)
+        if entry and entry[0] > now:
+            _INSIGHT_CACHE.move_to_end(key)
+            return entry[3]
+        if embedding is None:
+            return None
+
+        candidates = []
+        for cached_key, (expires_at, cached_context, cached_embedding, _) in list(_INSIGHT_CACHE.items()):
+            if expires_at <= now:
+                del _INSIGHT_CACHE[cached_key]
+            elif cached_embedding is not None and cached_context == context:
+                candidates.append((cached_key, cached_embedding))
+
+    best_key, best_score = None, INSIGHT_CACHE_SIMILARITY
+    for cached_key, cached_embedding in candidates:
+        # Both vectors are unit length, so the dot product is the cosine similarity
+        score = sum(map(operator.mul, embedding, cached_embedding))
+        if score >= best_score:
+            best_key, best_score = cached_key, score
+    if best_key is None:
+        return None
+
+    with _INSIGHT_CACHE_LOCK:
+        entry = _INSIGHT_CACHE.get(best_key)
+        if entry is None:  # evicted while scanning
+            return None
+        _INSIGHT_CACHE.move_to_end(best_key)
+        return entry[3]
+
+
+def _cache_store(key: str, context: str, embedding: Optional[list], content: str) -> None:
+    """Insert a completion into the insight cache, evicting least recently used entries."""
+    with _INSIGHT_CACHE_LOCK:
+        _INSIGHT_CACHE[key] = (time.monotonic() + INSIGHT_CACHE_TTL, context, embedding, content)
+        _INSIGHT_CACHE.move_to_end(key)
+        while len(_INSIGHT_CACHE) > INSIGHT_CACHE_MAXSIZE:
+            _INSIGHT_CACHE.popitem(last=False)
+
+
+# Static system prompt for wellness insights. Keep it identical across calls and longer
+# than 1024 tokens: OpenAI caches repeated prompt prefixes of that size, which lowers the
+# cost and latency of every call after the first. Per-call details go in the user message.
+# Only models with prompt caching (gpt-4o family and newer) benefit; on older models such
+# as gpt-3.5-turbo the long prompt is billed in full on every call.
+_COACH_SYSTEM_PROMPT = """You are a friendly, practical wellness coach inside a daily self-report app. \
+Each day a user rates four metrics and may describe how they feel physically in their own words. \
+Your job is to turn that narrative into a few concise, supportive, actionable suggestions.
+
+## Who you are
+- A warm, encouraging coach who focuses on everyday habits: sleep, hydration, nutrition, \
+movement, rest, stress management, and social connection.
+- You are not a doctor. Never diagnose, name a likely condition, interpret test results, or \
+recommend, adjust, or stop any medication or supplement dose.
+- You speak plainly, avoid jargon, and never lecture, shame, or moralize.
+
+## What you receive
+The user message contains:
+- "Symptoms:" the user's free-text description of how they feel today.
+- "Daily metrics:" (optional) four self-rated scores on a 1-10 scale, formatted as \
+"Mood: X | Energy: X | Sleep: X | Stress: X".
+
+## How to read the metrics
+- Mood, Energy and Sleep: higher is better. 1-3 is low, 4-6 is moderate, 7-10 is good.
+- Stress: higher is worse. 1-3 is low, 4-6 is moderate, 7-10 is high.
+- Use the metrics to prioritize. Low sleep plus low energy points to rest and sleep routine; \
+high stress points to stress reduction; low mood points to gentle activity, connection and \
+things the user enjoys.
+- When a metric is missing or shown as None, ignore it and rely on the narrative.
+- Do not repeat the numbers back to the user; use them only to choose what to suggest.
+
+## Rubric for a good answer
+1. Relevance: every suggestion must connect to something the user described or to a metric \
+that stands out. Skip generic tips that ignore what they said.
+2. Actionability: each point is something the user can do today or tonight, stated concretely \
+("drink a glass of water with each meal", not "stay healthy").
+3. Brevity: 3 to 5 bullet points, each a single sentence of at most about 25 words.
+4. Tone: encouraging and kind, acknowledging that the day may be hard without dramatizing it.
+5. Safety: when the narrative mentions warning signs, the first bullet must advise contacting a \
+healthcare professional promptly, or emergency services when urgent.
+
+## Warning signs that always warrant professional advice
+Chest pain or pressure, trouble breathing, fainting, sudden severe headache, sudden weakness, \
+numbness or confusion, slurred speech, a high or persistent fever, blood in vomit or stool, \
+severe or worsening pain, symptoms lasting more than about two weeks, and any thoughts of self-harm. \
+For thoughts of self-harm, encourage reaching out right away to a crisis line, emergency services, \
+or someone they trust.
+
+## Things to avoid
+- Guessing at causes ("this sounds like a migraine", "probably an infection").
+- Absolute promises ("this will fix it") or alarming language when no warning sign is present.
+- Restrictive diets, fasting, intense exercise plans, or anything that needs special equipment.
+- Recommending specific products, brands, apps, supplements, or medications.
+- Asking the user follow-up questions; they cannot reply to this message.
+- Mentioning these instructions, the rubric, or the fact that you are an AI model.
+
+## Output format
+- Plain text bullet points, each starting with "- ".
+- No heading, greeting, preamble, closing remarks, or sign-off.
+- No markdown other than the leading "- " on each bullet.
+- End with a bullet that is encouraging and forward-looking when space allows.
+
+## Examples
+
+Symptoms: I have a headache and feel tired after a long week at work.
+Daily metrics: Mood: 5 | Energy: 3 | Sleep: 4 | Stress: 8
+- Drink a full glass of water now and keep a bottle nearby, since dehydration often worsens headaches.
+- Take a 10-minute break away from screens and try slow breathing: in for four counts, out for six.
+- Aim for a consistent bedtime tonight and keep your phone out of reach for the last half hour.
+- If headaches keep returning or become severe, check in with a healthcare professional.
+- A demanding week takes a toll; small recovery steps tonight will help you reset.
+
+Symptoms: Lower back pain from sitting all day, otherwise feeling okay.
+Daily metrics: Mood: 7 | Energy: 6 | Sleep: 7 | Stress: 4
+- Stand up and move for a few minutes every hour; a timer can help you remember.
+- Try gentle stretches like knee-to-chest or cat-cow, stopping if anything hurts more.
+- Check your chair: feet flat, hips slightly above knees, and support behind your lower back.
+- A short walk after work can ease stiffness and keep your good mood going.
+
+Symptoms: Felt dizzy when I stood up this morning and have been a bit nauseous since breakfast.
+Daily metrics: Mood: 4 | Energy: 4 | Sleep: 6 | Stress: 5
+- If the dizziness returns often, comes with fainting or chest discomfort, or gets worse, contact a healthcare professional.
+- Sip water or an electrolyte drink steadily through the day rather than all at once.
+- Stand up slowly, pausing while sitting on the edge of the bed or chair first.
+- Choose small, bland meals such as toast, rice or bananas until your stomach settles.
+- Take it easy today and give yourself permission to rest."""
+
+
+def _llm_circuit_open() -> bool:
+    """True during the cool-down after repeated LLM failures; callers should fall back."""
+    return time.monotonic() < _CB['open_until']
+
+
+def _record_llm_outcome(success: bool) -> None:
+    """Reset the breaker on success; open it after LLM_CIRCUIT_THRESHOLD straight failures.
+
+    Once tripped, the first call after the cool-down is a trial: another failure reopens
+    the breaker immediately, a success closes it.
+    """
+    with _CB_LOCK:
+        if success:
+            if _CB['failures'] >= LLM_CIRCUIT_THRESHOLD:
+                app.logger.info('LLM circuit closed after a successful call.')
+            _CB['failures'] = 0
+            _CB['open_until'] = 0.0
+        else:
+            _CB['failures'] += 1
+            if _CB['failures'] >= LLM_CIRCUIT_THRESHOLD:
+                _CB['open_until'] = time.monotonic() + LLM_CIRCUIT_COOLDOWN
+                app.logger.warning(
+                    f"LLM circuit open for {LLM_CIRCUIT_COOLDOWN:g}s after "
+                    f"{_CB['failures']} consecutive failures."
+                )
+        LLM_STATUS['consecutive_failures'] = _CB['failures']
+        LLM_STATUS['circuit_open'] = _CB['failures'] >= LLM_CIRCUIT_THRESHOLD
+
+
+def _metrics_context(metrics: Optional[dict]) -> str:
+    """Format daily metrics for the prompt; empty when none were provided."""
+    if not metrics:
+        return ""
+    return (
+        f"Mood: {metrics.get('mood_score')} | "
+        f"Energy: {metrics.get('energy_level')} | "
+        f"Sleep: {metrics.get('sleep_quality')} | "
+        f"Stress: {metrics.get('stress_level')}"
+    )
+
+
+def _insight_messages(text: str, context: str) -> list:
+    """Chat messages asking the wellness coach for suggestions on a narrative.
+
+    The static system prompt comes first and never varies, so OpenAI can serve it from
+    its prompt cache; only the short user message changes between calls.
+    """
+    user_prompt = f"Symptoms: {text}" + (f"\nDaily metrics: {context}" if context else "")
+    return [
+        {"role": "system", "content": _COACH_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def _record_prompt_cache_usage(completion) -> None:
+    """Store how many prompt tokens OpenAI served from its prompt cache (when reported)."""
+    details = getattr(getattr(completion, 'usage', None), 'prompt_tokens_details', None)
+    cached_tokens = getattr(details, 'cached_tokens', None)
+    if cached_tokens is None and isinstance(details, dict):
+        cached_tokens = details.get('cached_tokens')
+    LLM_STATUS['last_cached_prompt_tokens'] = cached_tokens
+
+
+def _cached_insight(client, text: str, lower_text: str, context: str):
+    """Check the insight cache; returns (cache_key, embedding, cached completion or None)."""
+    cache_key = _insight_cache_key(lower_text, context)
+    embedding = None
+    cached = _cache_lookup(cache_key, context)
+    if cached is None:
+        # Only same-context entries are compared, so the narrative alone is embedded
+        embedding = _embed_text(client, text)
+        cached = _cache_lookup(cache_key, context, embedding)
+    if cached is not None:
+        LLM_STATUS['cache_hits'] += 1
+        LLM_STATUS['llm_success'] = True
+        LLM_STATUS['last_llm_error'] = None
+    return cache_key, embedding, cached
+
+
+def _llm_insights(text: str, lower_text: str, metrics: Optional[dict] = None) -> Optional[str]:
     """Call OpenAI Chat Completions to generate tailored wellness suggestions.
 
+    Takes the stripped narrative and its lowercase form, already checked against
+    MIN_SYMPTOM_LENGTH by the caller. Completions are served from the insight cache
+    when the same (or a semantically similar) narrative was answered recently.
     Returns None if not configured or on error, so the caller can fallback.
     """
-    if not OPENAI_API_KEY or OpenAI is None:
+    client = _OPENAI_CLIENT
+    if client is None:
         LLM_STATUS['enabled'] = False
         app.logger.info('LLM disabled: missing API key or OpenAI SDK.')
         return None
-    if not symptom_text or len(symptom_text.strip()) < 10:
-        return "No significant symptoms reported."
+    if _llm_circuit_open():
+        return None
 
     try:
         LLM_STATUS['llm_attempted'] = True
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        context = ""
-        if metrics:
-            context = (
-                f"Mood: {metrics.get('mood_score')} | "
-                f"Energy: {metrics.get('energy_level')} | "
-                f"Sleep: {metrics.get('sleep_quality')} | "
-                f"Stress: {metrics.get('stress_level')}"
-            )
-
-        system_prompt = (
-            "You are a friendly wellness coach. Provide concise, supportive suggestions "
-            "based on a user's symptom description (and optional daily metrics). "
-            "Avoid medical diagnosis; focus on lifestyle, rest, hydration, stress reduction, "
-            "and when to consider seeking professional advice. Return 3-5 short bullet points."
-        )
-
-        user_prompt = (
-            f"Symptoms: {symptom_text.strip()}\n" + (f"Daily metrics: {context}\n" if context else "") +
-            "Make it encouraging and actionable."
-        )
+        context = _metrics_context(metrics)
+        cache_key, embedding, cached = _cached_insight(client, text, lower_text, context)
+        if cached is not None:
+            return cached
+        if _llm_circuit_open():  # a failed embedding call just tripped the breaker
+            return None
 
         completion = client.chat.completions.create(
             model=OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
+            messages=_insight_messages(text, context),
             temperature=0.7,
             max_tokens=220,
         )
+        _record_llm_outcome(True)
 
+        _record_prompt_cache_usage(completion)
         content = completion.choices[0].message.content.strip() if completion.choices else None
         if not content:
             LLM_STATUS['llm_success'] = False
             LLM_STATUS['last_llm_error'] = 'Empty completion content'
             app.logger.warning('LLM call returned empty content.')
             return None
+        _cache_store(cache_key, context, embedding, content)
         LLM_STATUS['llm_success'] = True
         LLM_STATUS['last_llm_error'] = None
         return content
     except Exception as e:
         # Silent fallback keeps tests stable and app resilient without an API key
+        _record_llm_outcome(False)
         LLM_STATUS['llm_success'] = False
         LLM_STATUS['last_llm_error'] = str(e)
         app.logger.error(f'LLM call failed: {e}')
         return None
 
 
-def generate_ai_insights(symptom_text):
+def _stream_llm_insights(text: str, lower_text: str, metrics: Optional[dict] = None):
+    """Yield completion text as it is generated; a cached completion is yielded whole.
+
+    Takes the same normalized inputs as _llm_insights. Yields nothing if the LLM is not
+    configured. Errors are recorded in LLM_STATUS and re-raised so the caller can
+    discard partial output and fall back.
+    """
+    client = _OPENAI_CLIENT
+    if client is None:
+        LLM_STATUS['enabled'] = False
+        return
+    if _llm_circuit_open():
+        return
+
+    parts = []
+    try:
+        LLM_STATUS['llm_attempted'] = True
+        context = _metrics_context(metrics)
+        cache_key, embedding, cached = _cached_insight(client, text, lower_text, context)
+        if cached is not None:
+            yield cached
+            return
+        if _llm_circuit_open():  # a failed embedding call just tripped the breaker
+            return
+
+        stream = client.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=_insight_messages(text, context),
+            temperature=0.7,
+            max_tokens=220,
+            stream=True,
+        )
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
+    except Exception as e:
+        _record_llm_outcome(False)
+        LLM_STATUS['llm_success'] = False
+        LLM_STATUS['last_llm_error'] = str(e)
+        app.logger.error(f'LLM streaming call failed: {e}')
+        raise
+    _record_llm_outcome(True)
+
+    content = "".join(parts).strip()
+    if not content:
+        LLM_STATUS['llm_success'] = False
+        LLM_STATUS['last_llm_error'] = 'Empty completion content'
+        app.logger.warning('LLM stream returned empty content.')
+        raise ValueError('Empty completion content')
+    _cache_store(cache_key, context, embedding, content)
+    LLM_STATUS['llm_success'] = True
+    LLM_STATUS['last_llm_error'] = None
+
+
+def generate_ai_insights(symptom_text, metrics=None):
     """Generate insights from symptom narratives using LLM, with safe fallback.
 
     If OpenAI is configured via OPENAI_API_KEY, use it; otherwise, use deterministic keywords.
+    Pass the report's metrics (mood_score, energy_level, sleep_quality, stress_level) to
+    give the LLM more context; no request context is needed, so this runs on workers too.
     """
-    # Attempt LLM with additional context from latest metrics if available (in-request)
-    metrics = None
-    try:
-        # Pull metrics from request JSON when invoked within a request context
-        if request and request.is_json:
-            body = request.get_json(silent=True) or {}
-            metrics = {
-                'mood_score': body.get('mood_score'),
-                'energy_level': body.get('energy_level'),
-                'sleep_quality': body.get('sleep_quality'),
-                'stress_level': body.get('stress_level'),
-            }
-    except Exception:
-        metrics = None
+    # Normalize once: the stripped text is sent to the LLM and its lowercase form keys
+    # the insight cache and the keyword fallback (so equivalent narratives share entries)
+    text = (symptom_text or '').strip()
+    lower_text = text.lower()
+    if len(text) < MIN_SYMPTOM_LENGTH:
+        return _keyword_insights(lower_text)
 
-    ai_text = _llm_insights(symptom_text, metrics)
+    ai_text = _llm_insights(text, lower_text, metrics)
     if ai_text:
         return ai_text
-    return _keyword_insights(symptom_text)
+    return _keyword_insights(lower_text)
+
+
+def _fill_ai_insights(report_id, symptom_text, metrics):
+    """Generate insights for a stored report and save them; runs on the insights worker pool.
+
+    Jobs live only in this process: a job lost to a restart leaves the report pending
+    until a client opens its insights stream, which generates and stores them instead.
+    """
+    with app.app_context():
+        try:
+            ai_insights = generate_ai_insights(symptom_text, metrics)
+            # Keep insights already stored by the stream endpoint, as it does for ours
+            db.session.execute(
+                update(WellnessReport)
+                .where(WellnessReport.id == report_id, WellnessReport.ai_insights.is_(None))
+                .values(ai_insights=ai_insights)
+            )
+            db.session.commit()
+            return ai_insights
+        except Exception:
+            db.session.rollback()
+            app.logger.exception(f'Failed to store AI insights for report {report_id}')
+            return None
 
 
 @app.route('/api/ai-status', methods=['GET'])
@@ -342,11 +1045,109 @@ def ai_status():
         'llm_attempted': LLM_STATUS.get('llm_attempted', False),
         'llm_success': LLM_STATUS.get('llm_success', False),
         'last_llm_error': LLM_STATUS.get('last_llm_error'),
+        'cache_hits': LLM_STATUS.get('cache_hits', 0),
+        'last_cached_prompt_tokens': LLM_STATUS.get('last_cached_prompt_tokens'),
+        'consecutive_failures': LLM_STATUS.get('consecutive_failures', 0),
+        'circuit_open': _llm_circuit_open(),
         'has_api_key': bool(OPENAI_API_KEY),  # boolean only
         'sdk_available': bool(OpenAI is not None)
     })
 
+def upgrade_schema():
+    """Create missing tables and bring databases from older releases up to the current schema.
+
+    Older databases lack the unique (user_id, report_date) index that report submission's
+    ON CONFLICT clause relies on, and the server-side report_date/created_at defaults.
+    SQLite cannot add a column default with ALTER TABLE, so stale tables are rebuilt and
+    their rows copied over; other backends get the index and defaults added in place.
+    """
+    db.create_all()
+    inspector = inspect(db.engine)
+    stale = [table for table in db.metadata.sorted_tables if _table_outdated(inspector, table)]
+    if not stale:
+        return
+
+    app.logger.warning(f'Upgrading outdated tables: {", ".join(table.name for table in stale)}')
+    try:
+        _upgrade_tables(inspector, stale)
+    except IntegrityError as e:
+        raise RuntimeError(
+            'Schema upgrade failed: remove duplicate wellness reports (same user_id and '
+            'report_date) and restart') from e
+    # Pooled SQLite connections keep the schema they loaded; start fresh ones after the rebuild.
+    # A StaticPool (in-memory database) has only the connection that ran the upgrade, and
+    # disposing it would discard the database itself.
+    if not isinstance(db.engine.pool, StaticPool):
+        db.engine.dispose()
+
+def _upgrade_tables(inspector, stale):
+    """Rebuild (SQLite) or alter (other backends) tables that _table_outdated flagged."""
+    with db.engine.connect() as conn:
+        if conn.dialect.name == 'sqlite':
+            # Rebuilding a parent table needs foreign keys off; the pragma is ignored in a transaction
+            conn.exec_driver_sql('PRAGMA foreign_keys=OFF')
+            conn.commit()
+            try:
+                conn.exec_driver_sql('BEGIN')  # pysqlite does not open a transaction for DDL itself
+                for table in stale:
+                    _rebuild_sqlite_table(conn, table)
+                if conn.exec_driver_sql('PRAGMA foreign_key_check').first() is not None:
+                    raise RuntimeError('Schema upgrade found rows referencing missing users')
+                conn.commit()
+            finally:
+                conn.rollback()
+                conn.exec_driver_sql('PRAGMA foreign_keys=ON')
+                conn.commit()
+        else:
+            preparer = conn.dialect.identifier_preparer
+            for table in stale:
+                existing = inspector.get_columns(table.name)
+                for column in table.columns:
+                    if column.server_default is not None and not any(
+                            info['name'] == column.name and info['default'] for info in existing):
+                        default = column.server_default.arg.compile(dialect=conn.dialect)
+                        conn.exec_driver_sql(
+                            f'ALTER TABLE {preparer.format_table(table)} '
+                            f'ALTER COLUMN {preparer.format_column(column)} SET DEFAULT ({default})')
+                index_names = {index['name'] for index in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name not in index_names:
+                        index.create(conn)
+            conn.commit()
+
+def _table_outdated(inspector, table):
+    """True when a table is missing one of the model's named indexes or server defaults."""
+    index_names = {index['name'] for index in inspector.get_indexes(table.name)}
+    if any(index.name not in index_names for index in table.indexes):
+        return True
+    defaults = {column['name']: column['default'] for column in inspector.get_columns(table.name)}
+    return any(column.server_default is not None and not defaults.get(column.name)
+               for column in table.columns)
+
+def _rebuild_sqlite_table(conn, table):
+    """Recreate a SQLite table from the model and copy its rows across (SQLite's ALTER TABLE recipe)."""
+    preparer = conn.dialect.identifier_preparer
+    new_name = f'{table.name}_new'
+    conn.exec_driver_sql(f'DROP TABLE IF EXISTS {preparer.quote(new_name)}')
+    new_table = table.to_metadata(db.metadata, name=new_name)
+    try:
+        conn.execute(CreateTable(new_table))
+    finally:
+        db.metadata.remove(new_table)
+
+    existing = {column['name'] for column in inspect(conn).get_columns(table.name)}
+    columns = ', '.join(preparer.quote(column.name) for column in table.columns
+                        if column.name in existing)
+    conn.exec_driver_sql(
+        f'INSERT INTO {preparer.quote(new_name)} ({columns}) '
+        f'SELECT {columns} FROM {preparer.format_table(table)}')
+    conn.exec_driver_sql(f'DROP TABLE {preparer.format_table(table)}')
+    conn.exec_driver_sql(
+        f'ALTER TABLE {preparer.quote(new_name)} RENAME TO {preparer.format_table(table)}')
+    for index in table.indexes:
+        index.create(conn)
+
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        upgrade_schema()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
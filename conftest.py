@@ -0,0 +1,9 @@
+"""
+Pytest configuration for Wellness Tracker App
+"""
+
+import os
+
+# app.py builds its engine at import time, so the test database must be chosen before any
+# test module imports it; otherwise the suite runs against instance/wellness_tracker.db
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
@@ -52,7 +52,8 @@ async function submitWellnessReport(event) {
         energy_level: parseInt(document.getElementById('energy_level').value),
         sleep_quality: parseInt(document.getElementById('sleep_quality').value),
         stress_level: parseInt(document.getElementById('stress_level').value),
-        physical_symptoms: document.getElementById('physical_symptoms').value
+        physical_symptoms: document.getElementById('physical_symptoms').value,
+        stream_insights: true
     };
     
     try {
@@ -76,13 +77,19 @@ async function submitWellnessReport(event) {
             
             // Display AI insights if available
             if (data.ai_insights) {
-                document.getElementById('insights-text').textContent = data.ai_insights;
-                document.getElementById('ai-insights').style.display = 'block';
+                showInsights(data.ai_insights);
             }
             
             // Load user summary and reports
             loadUserSummary();
             loadRecentReports();
+            
+            // Insights are generated after the report is saved; stream or poll for them
+            if (data.insights_stream_url) {
+                streamInsights(data.insights_stream_url);
+            } else if (data.ai_insights_status === 'pending') {
+                pollInsights(response.headers.get('Location'));
+            }
         } else {
             alert(data.error || 'Error submitting report');
         }
@@ -92,6 +99,57 @@ async function submitWellnessReport(event) {
     }
 }
 
+function showInsights(text) {
+    document.getElementById('insights-text').textContent = text;
+    document.getElementById('ai-insights').style.display = 'block';
+}
+
+function streamInsights(streamUrl) {
+    const source = new EventSource(streamUrl);
+    let text = '';
+    
+    source.onmessage = event => {
+        text += JSON.parse(event.data);
+        showInsights(text);
+    };
+    // The server replaces a failed partial completion with its fallback text
+    source.addEventListener('replace', event => {
+        text = JSON.parse(event.data);
+        showInsights(text);
+    });
+    source.addEventListener('done', () => {
+        source.close();
+        loadRecentReports();
+    });
+    source.onerror = () => source.close();
+}
+
+async function pollInsights(reportUrl, attempts = 30) {
+    for (let i = 0; i < attempts; i++) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        try {
+            const response = await fetch(reportUrl);
+            const report = await response.json();
+            
+            if (!response.ok) {
+                return;
+            }
+            if (report.ai_insights_status === 'ready') {
+                if (report.ai_insights) {
+                    showInsights(report.ai_insights);
+                }
+                loadRecentReports();
+                return;
+            }
+        } catch (error) {
+            console.error('Error polling insights:', error);
+            return;
+        }
+    }
+    // Still pending (e.g. the server restarted mid-job): generate them over the stream instead
+    streamInsights(`${reportUrl}/insights/stream`);
+}
+
 async function loadUserData() {
     try {
         // Check if user has already submitted today's report
@@ -111,8 +169,7 @@ async function loadUserData() {
                 document.getElementById('wellness-score').textContent = todayReport.wellness_score;
                 
                 if (todayReport.ai_insights) {
-                    document.getElementById('insights-text').textContent = todayReport.ai_insights;
-                    document.getElementById('ai-insights').style.display = 'block';
+                    showInsights(todayReport.ai_insights);
                 }
                 
                 loadUserSummary();
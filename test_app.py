@@ -5,12 +5,12 @@ Tests for Wellness Tracker App
 import pytest
 import json
 from app import app, db, User, WellnessReport
-from datetime import date
+from datetime import datetime, timezone
 
 @pytest.fixture
 def client():
     app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['AI_INSIGHTS_ASYNC'] = False
     
     with app.test_client() as client:
         with app.app_context():
@@ -73,6 +73,171 @@ def test_submit_wellness_report(client):
     assert 'ai_insights' in data
     assert data['wellness_score'] > 0
 
+def test_duplicate_report_same_day(client):
+    """Test a second report for the same day is rejected"""
+    user_response = client.post('/api/users',
+                               json={'username': 'testuser'},
+                               content_type='application/json')
+    user_id = json.loads(user_response.data)['id']
+    report_data = {'mood_score': 8, 'energy_level': 7, 'sleep_quality': 6, 'stress_level': 4}
+
+    first = client.post(f'/api/users/{user_id}/reports', json=report_data)
+    second = client.post(f'/api/users/{user_id}/reports', json=report_data)
+
+    assert first.status_code == 201
+    assert second.status_code == 400
+    assert 'already submitted' in json.loads(second.data)['error']
+    assert WellnessReport.query.filter_by(user_id=user_id).count() == 1
+
+def test_submit_report_unknown_user(client):
+    """Test submitting a report for a missing user returns 404"""
+    report_data = {'mood_score': 8, 'energy_level': 7, 'sleep_quality': 6, 'stress_level': 4}
+    response = client.post('/api/users/999/reports', json=report_data)
+    assert response.status_code == 404
+
+def test_upgrade_schema_legacy_database(client):
+    """Test a database created before the unique index and server defaults is upgraded"""
+    from app import upgrade_schema
+
+    db.drop_all()
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql(
+            'CREATE TABLE user (id INTEGER NOT NULL, username VARCHAR(80) NOT NULL, '
+            'created_at DATETIME, PRIMARY KEY (id), UNIQUE (username))')
+        conn.exec_driver_sql(
+            'CREATE TABLE wellness_report (id INTEGER NOT NULL, user_id INTEGER NOT NULL, '
+            'report_date DATE, mood_score INTEGER, energy_level INTEGER, sleep_quality INTEGER, '
+            'stress_level INTEGER, physical_symptoms TEXT, wellness_score FLOAT, ai_insights TEXT, '
+            'created_at DATETIME, PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES user (id))')
+        conn.exec_driver_sql(
+            "INSERT INTO user (id, username, created_at) VALUES (1, 'legacy', '2024-01-01 08:00:00')")
+        conn.exec_driver_sql(
+            'INSERT INTO wellness_report (id, user_id, report_date, mood_score, energy_level, '
+            "sleep_quality, stress_level, wellness_score) VALUES (1, 1, '2024-01-01', 5, 5, 5, 5, 50.0)")
+
+    upgrade_schema()
+
+    report_data = {'mood_score': 8, 'energy_level': 7, 'sleep_quality': 6, 'stress_level': 4}
+    first = client.post('/api/users/1/reports', json=report_data)
+    second = client.post('/api/users/1/reports', json=report_data)
+    assert first.status_code == 201
+    assert second.status_code == 400
+
+    reports = json.loads(client.get('/api/users/1/reports').data)
+    assert [report['report_date'] for report in reports] == [
+        datetime.now(timezone.utc).date().isoformat(), '2024-01-01']
+    assert db.session.get(User, 1).username == 'legacy'
+    assert db.session.get(User, 1).created_at is not None
+
+def test_submit_report_async_insights(client):
+    """Test insights are generated in the background and exposed for polling"""
+    import time
+
+    user_response = client.post('/api/users',
+                               json={'username': 'testuser'},
+                               content_type='application/json')
+    user_id = json.loads(user_response.data)['id']
+    report_data = {
+        'mood_score': 6,
+        'energy_level': 4,
+        'sleep_quality': 5,
+        'stress_level': 6,
+        'physical_symptoms': 'Mild headache and feeling tired'
+    }
+
+    app.config['AI_INSIGHTS_ASYNC'] = True
+    try:
+        response = client.post(f'/api/users/{user_id}/reports', json=report_data)
+    finally:
+        app.config['AI_INSIGHTS_ASYNC'] = False
+
+    assert response.status_code == 202
+    data = json.loads(response.data)
+    assert data['ai_insights_status'] == 'pending'
+    location = response.headers['Location']
+    assert location.endswith(f'/api/users/{user_id}/reports/{data["id"]}')
+
+    for _ in range(50):
+        report = json.loads(client.get(location).data)
+        if report['ai_insights_status'] == 'ready':
+            break
+        time.sleep(0.05)
+    assert 'hydrated' in report['ai_insights'].lower()
+    assert client.get(f'/api/users/{user_id}/reports/{data["id"] + 1}').status_code == 404
+
+def test_report_reads_unknown_user(client):
+    """Test report reads return 404 for missing users and empty results for new users"""
+    assert client.get('/api/users/999/reports').status_code == 404
+    assert client.get('/api/users/999/wellness-summary').status_code == 404
+
+    user_response = client.post('/api/users',
+                               json={'username': 'testuser'},
+                               content_type='application/json')
+    user_id = json.loads(user_response.data)['id']
+    response = client.get(f'/api/users/{user_id}/reports')
+    assert response.status_code == 200
+    assert json.loads(response.data) == []
+    summary = client.get(f'/api/users/{user_id}/wellness-summary')
+    assert summary.status_code == 404
+    assert json.loads(summary.data)['message'] == 'No reports found'
+
+def test_submit_reports_batch(client):
+    """Test bulk import of historical reports"""
+    from app import calculate_wellness_scores_batch
+
+    user_response = client.post('/api/users',
+                               json={'username': 'testuser'},
+                               content_type='application/json')
+    user_id = json.loads(user_response.data)['id']
+    reports = [
+        {'report_date': '2024-01-01', 'mood_score': 9, 'energy_level': 8, 'sleep_quality': 9, 'stress_level': 2},
+        {'report_date': '2024-01-02', 'mood_score': 3, 'energy_level': 2, 'sleep_quality': 3, 'stress_level': 9,
+         'physical_symptoms': 'Headache all day'},
+    ]
+
+    response = client.post(f'/api/users/{user_id}/reports/batch', json={'reports': reports})
+    assert response.status_code == 201
+    data = json.loads(response.data)
+    assert data['inserted'] == 2
+    assert data['wellness_scores'] == calculate_wellness_scores_batch([(9, 8, 9, 2), (3, 2, 3, 9)])
+
+    stored = json.loads(client.get(f'/api/users/{user_id}/reports').data)
+    assert [r['report_date'] for r in stored] == ['2024-01-02', '2024-01-01']
+    assert stored[0]['physical_symptoms'] == 'Headache all day'
+    assert 'hydrated' in stored[0]['ai_insights'].lower()
+    assert stored[1]['ai_insights'] is None
+    report = json.loads(client.get(f'/api/users/{user_id}/reports/{stored[0]["id"]}').data)
+    assert report['ai_insights_status'] == 'ready'
+
+    # Re-importing an existing date rejects the whole batch
+    duplicate = client.post(f'/api/users/{user_id}/reports/batch', json={'reports': reports[:1]})
+    assert duplicate.status_code == 400
+    missing_date = client.post(f'/api/users/{user_id}/reports/batch',
+                               json={'reports': [{'mood_score': 5, 'energy_level': 5,
+                                                  'sleep_quality': 5, 'stress_level': 5}]})
+    assert missing_date.status_code == 400
+    assert 'report_date' in json.loads(missing_date.data)['error']
+    today = datetime.now(timezone.utc).date().isoformat()
+    current_day = client.post(f'/api/users/{user_id}/reports/batch',
+                              json={'reports': [dict(reports[0], report_date=today)]})
+    assert current_day.status_code == 400
+    assert 'before today' in json.loads(current_day.data)['error']
+    not_object = client.post(f'/api/users/{user_id}/reports/batch', json=[{'a': 1}])
+    assert not_object.status_code == 400
+    string_metric = client.post(f'/api/users/{user_id}/reports/batch',
+                                json={'reports': [dict(reports[0], report_date='2024-02-01', mood_score='5')]})
+    assert string_metric.status_code == 400
+    assert 'reports[0].mood_score' in json.loads(string_metric.data)['error']
+    number_symptoms = client.post(f'/api/users/{user_id}/reports/batch',
+                                  json={'reports': [dict(reports[0], report_date='2024-02-01',
+                                                         physical_symptoms=123456789012)]})
+    assert number_symptoms.status_code == 400
+    assert 'reports[0].physical_symptoms' in json.loads(number_symptoms.data)['error']
+    unknown_user = client.post('/api/users/999/reports/batch',
+                               json={'reports': [dict(reports[0], report_date='2024-02-01')]})
+    assert unknown_user.status_code == 404
+    assert WellnessReport.query.filter_by(user_id=user_id).count() == 2
+
 def test_wellness_score_calculation():
     """Test wellness score calculation logic"""
     from app import calculate_wellness_score
@@ -97,6 +262,17 @@ def test_wellness_score_calculation():
     score = calculate_wellness_score(low_wellness_data)
     assert score < 40  # Should be low score
 
+def test_wellness_scores_batch():
+    """Test batch scoring matches single-report scoring"""
+    from app import calculate_wellness_score, calculate_wellness_scores_batch
+
+    rows = [(9, 8, 9, 2), (3, 2, 3, 9), (5, 5, 5, 5)]
+    expected = [calculate_wellness_score({
+        'mood_score': m, 'energy_level': e, 'sleep_quality': s, 'stress_level': st
+    }) for m, e, s, st in rows]
+    assert calculate_wellness_scores_batch(rows) == expected
+    assert calculate_wellness_scores_batch([(5, 5, 5, 5)]) == [50.0]
+
 def test_get_wellness_reports(client):
     """Test getting wellness reports"""
     # Create user and submit report
@@ -124,6 +300,8 @@ def test_get_wellness_reports(client):
     data = json.loads(response.data)
     assert len(data) == 1
     assert data[0]['mood_score'] == 8
+    assert data[0]['report_date'] == datetime.now(timezone.utc).date().isoformat()
+    assert response.content_type == 'application/json'
 
 def test_wellness_summary(client):
     """Test wellness summary endpoint"""
@@ -153,6 +331,8 @@ def test_wellness_summary(client):
     assert 'average_wellness_score' in data
     assert 'averages' in data
     assert data['total_reports'] == 1
+    assert data['averages']['mood_score'] == 8
+    assert data['latest_report_date'] == datetime.now(timezone.utc).date().isoformat()
 
 def test_ai_insights_generation():
     """Test AI insights generation"""
@@ -188,5 +368,252 @@ def test_missing_required_fields(client):
     data = json.loads(response.data)
     assert 'required' in data['error']
 
+def test_wellness_reports_relationship_requires_explicit_load(client):
+    """Test lazy access to User.wellness_reports raises instead of issuing N+1 selects"""
+    from sqlalchemy.exc import InvalidRequestError
+    from sqlalchemy.orm import selectinload
+
+    user_response = client.post('/api/users',
+                               json={'username': 'testuser'},
+                               content_type='application/json')
+    user_id = json.loads(user_response.data)['id']
+    client.post(f'/api/users/{user_id}/reports',
+                json={'mood_score': 8, 'energy_level': 7, 'sleep_quality': 6, 'stress_level': 4},
+                content_type='application/json')
+    db.session.expunge_all()
+
+    with pytest.raises(InvalidRequestError):
+        db.session.get(User, user_id).wellness_reports
+    db.session.expunge_all()
+
+    user = db.session.query(User).options(selectinload(User.wellness_reports))\
+        .filter_by(id=user_id).one()
+    assert len(user.wellness_reports) == 1
+    assert user.wellness_reports[0].user is user
+
+def _fake_openai(calls, embedding=(1.0, 0.0)):
+    """Build a stand-in OpenAI client that records chat completion calls."""
+    from types import SimpleNamespace
+
+    def create_completion(**kwargs):
+        calls.append(kwargs)
+        content = f"- Advice #{len(calls)}"
+        if kwargs.get('stream'):
+            return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=part))])
+                         for part in (content[:4], content[4:], None)])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    def create_embedding(**kwargs):
+        return SimpleNamespace(data=[SimpleNamespace(embedding=list(embedding))])
+
+    client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create_completion)),
+        embeddings=SimpleNamespace(create=create_embedding),
+    )
+    return client
+
+def test_llm_insights_cache(monkeypatch):
+    """Test repeated and similar narratives are served from the insight cache"""
+    import app as app_module
+
+    calls = []
+    monkeypatch.setattr(app_module, '_OPENAI_CLIENT', _fake_openai(calls))
+    app_module._INSIGHT_CACHE.clear()
+
+    first = app_module.generate_ai_insights("I have a headache and feel tired")
+    # Case and whitespace differences hit the exact cache key
+    second = app_module.generate_ai_insights("  i have a HEADACHE and feel   tired ")
+    # A different narrative with an identical embedding is a semantic hit
+    third = app_module.generate_ai_insights("My head hurts and I am exhausted")
+
+    assert first == second == third == "- Advice #1"
+    assert len(calls) == 1
+
+    # A similar narrative with different metrics is not a semantic hit
+    metrics = {'mood_score': 3, 'energy_level': 2, 'sleep_quality': 3, 'stress_level': 9}
+    assert app_module.generate_ai_insights("My head hurts and I am exhausted", metrics) == "- Advice #2"
+    assert app_module.generate_ai_insights("My head is pounding, I am exhausted", metrics) == "- Advice #2"
+    assert len(calls) == 2
+
+def test_stream_ai_insights(client, monkeypatch):
+    """Test insights stream as server-sent events and are stored when the stream ends"""
+    import app as app_module
+
+    calls = []
+    monkeypatch.setattr(app_module, '_OPENAI_CLIENT', _fake_openai(calls))
+    app_module._INSIGHT_CACHE.clear()
+
+    user_response = client.post('/api/users',
+                               json={'username': 'testuser'},
+                               content_type='application/json')
+    user_id = json.loads(user_response.data)['id']
+    report_data = {
+        'mood_score': 6,
+        'energy_level': 4,
+        'sleep_quality': 5,
+        'stress_level': 6,
+        'physical_symptoms': 'Mild headache and feeling tired',
+        'stream_insights': True
+    }
+
+    response = client.post(f'/api/users/{user_id}/reports', json=report_data)
+    assert response.status_code == 202
+    stream_url = json.loads(response.data)['insights_stream_url']
+
+    stream = client.get(stream_url)
+    assert stream.mimetype == 'text/event-stream'
+    body = stream.get_data(as_text=True)
+    assert body == 'data: "- Ad"\n\ndata: "vice #1"\n\nevent: done\ndata: ""\n\n'
+    assert len(calls) == 1
+
+    report = json.loads(client.get(response.headers['Location']).data)
+    assert report['ai_insights'] == '- Advice #1'
+    assert report['ai_insights_status'] == 'ready'
+
+    # Stored insights are replayed without another LLM call
+    assert 'data: "- Advice #1"' in client.get(stream_url).get_data(as_text=True)
+    assert len(calls) == 1
+
+    # A late background job does not overwrite the streamed insights
+    app_module._INSIGHT_CACHE.clear()
+    assert app_module._fill_ai_insights(report['id'], report_data['physical_symptoms'], None) == '- Advice #2'
+    assert json.loads(client.get(response.headers['Location']).data)['ai_insights'] == '- Advice #1'
+
+def test_insight_prompt_static_prefix():
+    """Test the system prompt is a shared static prefix and the user message holds the inputs"""
+    from app import _COACH_SYSTEM_PROMPT, _insight_messages
+
+    first = _insight_messages("Headache and tired", "Mood: 5 | Energy: 3 | Sleep: 4 | Stress: 8")
+    second = _insight_messages("Lower back pain", "")
+
+    assert first[0] == second[0] == {"role": "system", "content": _COACH_SYSTEM_PROMPT}
+    # OpenAI only caches prefixes of at least 1024 tokens. At roughly 4 characters or
+    # 0.75 words per token, the prompt needs about 5000 characters and 850 words
+    assert len(_COACH_SYSTEM_PROMPT) >= 5000
+    assert len(_COACH_SYSTEM_PROMPT.split()) >= 850
+    assert first[1]['content'] == (
+        "Symptoms: Headache and tired\nDaily metrics: Mood: 5 | Energy: 3 | Sleep: 4 | Stress: 8")
+    assert second[1]['content'] == "Symptoms: Lower back pain"
+
+def test_report_endpoints_etag(client):
+    """Test report listings and summaries answer If-None-Match with 304 until data changes"""
+    user_response = client.post('/api/users',
+                               json={'username': 'testuser'},
+                               content_type='application/json')
+    user_id = json.loads(user_response.data)['id']
+    client.post(f'/api/users/{user_id}/reports',
+                json={'mood_score': 8, 'energy_level': 7, 'sleep_quality': 6, 'stress_level': 4})
+
+    etags = {}
+    for url in (f'/api/users/{user_id}/reports', f'/api/users/{user_id}/wellness-summary'):
+        response = client.get(url)
+        etag = etags[url] = response.headers['ETag']
+        assert response.status_code == 200
+        assert response.headers['Cache-Control'] == 'private, no-cache'
+
+        cached = client.get(url, headers={'If-None-Match': etag})
+        assert cached.status_code == 304
+        assert cached.data == b''
+
+    # Filling in insights changes the listing's validator, but not the summary's (no insights in it)
+    report = WellnessReport.query.filter_by(user_id=user_id).one()
+    report.ai_insights = 'Keep it up.'
+    db.session.commit()
+    url = f'/api/users/{user_id}/reports'
+    response = client.get(url, headers={'If-None-Match': etags[url]})
+    assert response.status_code == 200
+    assert json.loads(response.data)[0]['ai_insights'] == 'Keep it up.'
+    summary_url = f'/api/users/{user_id}/wellness-summary'
+    assert client.get(summary_url, headers={'If-None-Match': etags[summary_url]}).status_code == 304
+
+    # Only insights within the returned window count: filling in an older report's
+    # insights does not change the validator of a 1-day listing
+    client.post(f'/api/users/{user_id}/reports/batch', json={'reports': [
+        {'report_date': '2024-01-01', 'mood_score': 5, 'energy_level': 5, 'sleep_quality': 5,
+         'stress_level': 5}]})
+    url = f'/api/users/{user_id}/reports?days=1'
+    etag = client.get(url).headers['ETag']
+    old_report = WellnessReport.query.filter_by(user_id=user_id, ai_insights=None).one()
+    old_report.ai_insights = 'Older insight.'
+    db.session.commit()
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+def test_trivial_symptoms_skip_insights(client, monkeypatch):
+    """Test very short symptom text skips insight generation entirely"""
+    import app as app_module
+
+    calls = []
+    monkeypatch.setattr(app_module, '_OPENAI_CLIENT', _fake_openai(calls))
+    user_response = client.post('/api/users',
+                               json={'username': 'testuser'},
+                               content_type='application/json')
+    user_id = json.loads(user_response.data)['id']
+
+    app.config['AI_INSIGHTS_ASYNC'] = True
+    try:
+        response = client.post(f'/api/users/{user_id}/reports', json={
+            'mood_score': 8, 'energy_level': 7, 'sleep_quality': 6, 'stress_level': 4,
+            'physical_symptoms': '  fine   '
+        })
+    finally:
+        app.config['AI_INSIGHTS_ASYNC'] = False
+
+    assert response.status_code == 201
+    data = json.loads(response.data)
+    assert data['ai_insights'] is None
+    assert data['ai_insights_status'] == 'ready'
+    report = json.loads(client.get(f'/api/users/{user_id}/reports/{data["id"]}').data)
+    assert report['ai_insights_status'] == 'ready'
+
+    # Opening the stream does not store fallback insights for a trivial narrative
+    stream = client.get(f'/api/users/{user_id}/reports/{data["id"]}/insights/stream')
+    assert stream.get_data(as_text=True) == 'event: done\ndata: ""\n\n'
+    report = json.loads(client.get(f'/api/users/{user_id}/reports/{data["id"]}').data)
+    assert report['ai_insights'] is None
+    assert calls == []
+
+def test_llm_circuit_breaker(monkeypatch):
+    """Test repeated LLM failures open the circuit and fall back without calling OpenAI"""
+    from types import SimpleNamespace
+    import app as app_module
+
+    attempts = []
+
+    def failing_completion(**kwargs):
+        attempts.append(kwargs)
+        raise TimeoutError('provider timed out')
+
+    failing_client = _fake_openai([])
+    failing_client.chat.completions = SimpleNamespace(create=failing_completion)
+    monkeypatch.setattr(app_module, '_OPENAI_CLIENT', failing_client)
+    monkeypatch.setattr(app_module, '_CB', {'failures': 0, 'open_until': 0.0})
+    monkeypatch.setattr(app_module, 'LLM_CIRCUIT_THRESHOLD', 3)
+    app_module._INSIGHT_CACHE.clear()
+
+    for i in range(5):
+        insights = app_module.generate_ai_insights(f"Headache number {i} since this morning")
+        assert 'hydrated' in insights.lower()
+    assert len(attempts) == 3
+    assert app_module.LLM_STATUS['circuit_open'] is True
+    assert app_module._llm_circuit_open()
+
+    # A failed embedding call during the half-open trial reopens the circuit before the completion
+    def failing_embedding(**kwargs):
+        raise TimeoutError('provider timed out')
+
+    failing_client.embeddings = SimpleNamespace(create=failing_embedding)
+    app_module._CB['open_until'] = 0.0
+    assert 'hydrated' in app_module.generate_ai_insights("Headache during the trial call").lower()
+    assert len(attempts) == 3
+    assert app_module._llm_circuit_open()
+
+    # After the cool-down a successful trial call closes the circuit
+    calls = []
+    monkeypatch.setattr(app_module, '_OPENAI_CLIENT', _fake_openai(calls))
+    app_module._CB['open_until'] = 0.0
+    assert app_module.generate_ai_insights("Headache again this evening") == "- Advice #1"
+    assert app_module.LLM_STATUS['circuit_open'] is False
+    assert app_module._CB['failures'] == 0
+
 if __name__ == '__main__':
     pytest.main([__file__])
\ No newline at end of file